@@ -4,49 +4,103 @@
 """
 Metrics Exporter for Network Monitor
 
-Now also exports active connection details (IPs/domains).
+Now also exports active connection details (IPs/domains), given as
+(remote_ip, remote_port, hostname) tuples such as network_monitor.Conn.
 """
 
 import time
+import queue
 import logging
-from typing import Dict, Optional, List
+import threading
+
+import psutil
+from typing import Dict, Optional, List, Tuple
 
 logger = logging.getLogger(__name__)
 
 try:
-    from prometheus_client import start_http_server, Gauge
+    from prometheus_client import start_http_server, Counter, Gauge, REGISTRY
+    from prometheus_client.core import CounterMetricFamily
     PROMETHEUS_AVAILABLE = True
 except ImportError:
     logger.warning("prometheus_client not installed. Prometheus export will not be available.")
     PROMETHEUS_AVAILABLE = False
 
 try:
-    from influxdb_client import InfluxDBClient, Point
-    from influxdb_client.client.write_api import SYNCHRONOUS
+    from influxdb_client import InfluxDBClient, WritePrecision
+    from influxdb_client.client.write_api import WriteOptions
     INFLUXDB_AVAILABLE = True
 except ImportError:
     logger.warning("influxdb_client not installed. InfluxDB export will not be available.")
     INFLUXDB_AVAILABLE = False
 
 
+# Characters that must be backslash-escaped in line protocol tag keys/values
+_TAG_ESCAPES = str.maketrans({"\\": "\\\\", ",": "\\,", "=": "\\=", " ": "\\ "})
+
+
+def _escape_tag(value) -> str:
+    """Escape a tag key or value for InfluxDB line protocol."""
+    return str(value).translate(_TAG_ESCAPES)
+
+
+class NetIOCollector:
+    """
+    Expose the host's cumulative byte counters as Prometheus counters.
+
+    Values are read from psutil at scrape time, so there is no per-tick work;
+    rates are computed server-side, e.g. rate(network_bytes_sent_total[1m]) * 8 / 1e6.
+    """
+
+    def collect(self):
+        io = psutil.net_io_counters()
+        yield CounterMetricFamily('network_bytes_sent', 'Total bytes sent on all interfaces', value=io.bytes_sent)
+        yield CounterMetricFamily('network_bytes_recv', 'Total bytes received on all interfaces', value=io.bytes_recv)
+
+
 class PrometheusExporter:
     """Export network metrics to Prometheus."""
 
-    def __init__(self, port: int = 8000):
+    # Speed changes smaller than this (in Mbps) don't update the gauges
+    CHANGE_EPSILON = 1e-3
+
+    def __init__(self, port: int = 8000, max_stale: float = 10.0, track_connections: bool = True,
+                 max_connection_series: int = 1024, byte_counters: bool = True):
         if not PROMETHEUS_AVAILABLE:
             raise ImportError("prometheus_client is required for Prometheus export")
 
         self.port = port
+        self.max_stale = max_stale
+        self.max_connection_series = max_connection_series
+        self._last_up: Optional[float] = None
+        self._last_down: Optional[float] = None
+        self._last_up_t = 0.0
+        self._last_down_t = 0.0
+        self.net_io_collector = None
+        if byte_counters:
+            self.net_io_collector = NetIOCollector()
+            REGISTRY.register(self.net_io_collector)
         self.upload_gauge = Gauge('network_upload_mbps', 'Network upload speed in Mbps')
         self.download_gauge = Gauge('network_download_mbps', 'Network download speed in Mbps')
-        self.active_connections_gauge = Gauge(
-            'network_active_connections', 'Number of active network connections'
-        )
-        self.connection_info_gauge = Gauge(
-            'network_connection_info',
-            'Active connection info (value=1 means active)',
-            ['remote_ip', 'hostname', 'port']
-        )
+        self.active_connections_gauge = None
+        self.connection_info_gauge = None
+        self.connection_info_dropped = None
+        if track_connections:
+            self.active_connections_gauge = Gauge(
+                'network_active_connections', 'Number of active network connections'
+            )
+            self.connection_info_gauge = Gauge(
+                'network_connection_info',
+                'Active connection info (value=1 means active)',
+                ['remote_ip', 'hostname', 'port']
+            )
+            self.connection_info_dropped = Counter(
+                'network_connection_info_dropped',
+                'Connection info series skipped to bound label cardinality'
+            )
+        # Child gauges bound once per label tuple, keyed by (remote_ip, hostname, port);
+        # at most max_connection_series of them exist at a time
+        self._conn_children: Dict[Tuple[str, str, str], Gauge] = {}
         self.server_started = False
 
     def start_server(self):
@@ -59,35 +113,58 @@ class PrometheusExporter:
         self,
         upload_speed: float,
         download_speed: float,
-        connections: Optional[List[Dict]] = None
+        tags: Optional[Dict[str, str]] = None,
+        connections: Optional[List[Tuple[str, str, str]]] = None,
+        timestamp_ns: Optional[int] = None
     ):
+        # tags and timestamp_ns are not exported to Prometheus (the scrape sets the time);
+        # accepted for a uniform exporter signature
         if not self.server_started:
             self.start_server()
 
-        self.upload_gauge.set(upload_speed)
-        self.download_gauge.set(download_speed)
-
-        if connections is not None:
+        # Gauges keep their value between scrapes, so skip unchanged updates
+        now = time.monotonic()
+        if (self._last_up is None or abs(upload_speed - self._last_up) > self.CHANGE_EPSILON
+                or now - self._last_up_t > self.max_stale):
+            self.upload_gauge.set(upload_speed)
+            self._last_up, self._last_up_t = upload_speed, now
+        if (self._last_down is None or abs(download_speed - self._last_down) > self.CHANGE_EPSILON
+                or now - self._last_down_t > self.max_stale):
+            self.download_gauge.set(download_speed)
+            self._last_down, self._last_down_t = download_speed, now
+
+        if connections is not None and self.connection_info_gauge is not None:
             self.active_connections_gauge.set(len(connections))
 
-            # Reset old values
-            self.connection_info_gauge.clear()
-
-            for conn in connections:
-                self.connection_info_gauge.labels(
-                    remote_ip=conn.get("remote_ip", "unknown"),
-                    hostname=conn.get("hostname", "N/A"),
-                    port=str(conn.get("remote_port", "0"))
-                ).set(1)
-
-        logger.debug(f"Exported to Prometheus: Upload={upload_speed:.2f}, Download={download_speed:.2f}")
+            # Only touch label series that appeared or disappeared since the last tick
+            cur = {(ip, host, port) for ip, port, host in connections}
+            for labels in self._conn_children.keys() - cur:
+                self.connection_info_gauge.remove(*labels)
+                del self._conn_children[labels]
+            # Series already exported stay put; new ones are bound in connection order
+            # only while there is room, so a full set never evicts active connections
+            room = self.max_connection_series - len(self._conn_children)
+            for ip, port, host in connections:
+                labels = (ip, host, port)
+                if labels in self._conn_children:
+                    continue
+                if room <= 0:
+                    self.connection_info_dropped.inc()
+                    continue
+                child = self.connection_info_gauge.labels(*labels)
+                child.set(1)
+                self._conn_children[labels] = child
+                room -= 1
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Exported to Prometheus: Upload=%.2f, Download=%.2f", upload_speed, download_speed)
 
 
 class InfluxDBExporter:
     """Export network metrics to InfluxDB."""
 
     def __init__(self, url="http://localhost:8086", token="", org="", bucket="network_metrics",
-                 batch_size=10, flush_interval=10):
+                 batch_size=1000, flush_interval=2):
         if not INFLUXDB_AVAILABLE:
             raise ImportError("influxdb_client is required for InfluxDB export")
 
@@ -97,11 +174,23 @@ class InfluxDBExporter:
         self.bucket = bucket
         self.batch_size = batch_size
         self.flush_interval = flush_interval
-        self.points_buffer: List[Point] = []
-        self.last_flush_time = time.time()
+        # Reused line buffer; the write API encodes each line on write(), so it can be cleared after
+        self._lines: List[str] = []
+        # Serializes write() and close() when the exporter is shared between threads
+        self._lock = threading.Lock()
+        self._closed = False
+        # Escaped ",k=v" tag suffix shared by every line, rebuilt only when the tags change
+        self._tags: Optional[Dict[str, str]] = None
+        self._tag_suffix = ""
 
         self.client = InfluxDBClient(url=url, token=token, org=org)
-        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+        # The client's batching WriteApi buffers points and writes them from its own thread
+        self.write_api = self.client.write_api(write_options=WriteOptions(
+            batch_size=batch_size,
+            flush_interval=int(flush_interval * 1000),
+            jitter_interval=200,
+            retry_interval=5000
+        ))
         logger.info(f"InfluxDB exporter initialized for {url}, bucket: {bucket}")
 
     def export_metrics(
@@ -109,64 +198,72 @@ class InfluxDBExporter:
         upload_speed: float,
         download_speed: float,
         tags: Optional[Dict[str, str]] = None,
-        connections: Optional[List[Dict]] = None
+        connections: Optional[List[Tuple[str, str, str]]] = None,
+        timestamp_ns: Optional[int] = None
     ):
-        point = Point("network_bandwidth")
-        if tags:
-            for k, v in tags.items():
-                point = point.tag(k, v)
-
-        point = point.field("upload_mbps", upload_speed)
-        point = point.field("download_mbps", download_speed)
-        self.points_buffer.append(point)
-
-        if connections:
-            for conn in connections:
-                conn_point = Point("network_connection") \
-                    .tag("remote_ip", conn.get("remote_ip", "unknown")) \
-                    .tag("hostname", conn.get("hostname", "N/A")) \
-                    .tag("port", str(conn.get("remote_port", "0"))) \
-                    .field("active", 1)
-                if tags:
-                    for k, v in tags.items():
-                        conn_point = conn_point.tag(k, v)
-                self.points_buffer.append(conn_point)
-
-        current_time = time.time()
-        if (len(self.points_buffer) >= self.batch_size or
-                (current_time - self.last_flush_time) >= self.flush_interval):
-            self.flush()
-
-    def flush(self):
-        if not self.points_buffer:
-            return
-        try:
-            self.write_api.write(bucket=self.bucket, record=self.points_buffer)
-            logger.debug(f"Flushed {len(self.points_buffer)} points to InfluxDB")
-            self.points_buffer = []
-            self.last_flush_time = time.time()
-        except Exception as e:
-            logger.error(f"Error writing to InfluxDB: {e}")
+        # Build line protocol directly; one write() call per sample, stamped with
+        # the time the sample was taken rather than the time it is exported
+        ts = timestamp_ns if timestamp_ns is not None else time.time_ns()
+        if tags != self._tags:
+            self._tags = dict(tags) if tags else None
+            self._tag_suffix = "".join(
+                f",{_escape_tag(k)}={_escape_tag(v)}" for k, v in tags.items() if v
+            ) if tags else ""
+        extra = self._tag_suffix
+
+        with self._lock:
+            if self._closed:
+                return
+            lines = self._lines
+            lines.append(f"network_bandwidth{extra} upload_mbps={float(upload_speed)},download_mbps={float(download_speed)} {ts}")
+
+            if connections:
+                for ip, port, host in connections:
+                    lines.append(
+                        f"network_connection,remote_ip={_escape_tag(ip)},hostname={_escape_tag(host)},"
+                        f"port={_escape_tag(port)}{extra} active=1i {ts}"
+                    )
+
+            try:
+                self.write_api.write(bucket=self.bucket, record=lines, write_precision=WritePrecision.NS)
+            finally:
+                lines.clear()
 
     def close(self):
-        self.flush()
-        self.client.close()
+        # The batching WriteApi only writes out pending points on close(); its flush() is a no-op
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.write_api.close()
+            self.client.close()
         logger.info("InfluxDB connection closed")
 
 
 class MetricsExporter:
-    """Unified interface for exporting metrics to different backends."""
+    """Unified interface for exporting metrics to different backends.
+
+    Samples are queued and dispatched to the backends on a background thread,
+    so the monitor loop never waits on Prometheus locks or InfluxDB writes.
+    """
 
-    def __init__(self):
+    _STOP = object()
+
+    def __init__(self, queue_size: int = 256):
+        # (exporter, bound export_metrics) pairs; every exporter shares one signature
         self.exporters = []
+        self.dropped_samples = 0
+        self._q = queue.Queue(maxsize=queue_size)
+        self._worker = threading.Thread(target=self._drain, name="metrics-exporter", daemon=True)
+        self._worker.start()
 
-    def add_prometheus_exporter(self, port: int = 8000):
+    def add_prometheus_exporter(self, port: int = 8000, track_connections: bool = True):
         if not PROMETHEUS_AVAILABLE:
             logger.warning("Cannot add Prometheus exporter: prometheus_client not installed")
             return False
         try:
-            exporter = PrometheusExporter(port=port)
-            self.exporters.append(exporter)
+            exporter = PrometheusExporter(port=port, track_connections=track_connections)
+            self.exporters.append((exporter, exporter.export_metrics))
             logger.info(f"Prometheus exporter added on port {port}")
             return True
         except Exception as e:
@@ -174,7 +271,7 @@ class MetricsExporter:
             return False
 
     def add_influxdb_exporter(self, url="http://localhost:8086", token="", org="",
-                              bucket="network_metrics", batch_size=10, flush_interval=10):
+                              bucket="network_metrics", batch_size=1000, flush_interval=2):
         if not INFLUXDB_AVAILABLE:
             logger.warning("Cannot add InfluxDB exporter: influxdb_client not installed")
             return False
@@ -183,7 +280,7 @@ class MetricsExporter:
                 url=url, token=token, org=org, bucket=bucket,
                 batch_size=batch_size, flush_interval=flush_interval
             )
-            self.exporters.append(exporter)
+            self.exporters.append((exporter, exporter.export_metrics))
             logger.info(f"InfluxDB exporter added for {url}, bucket: {bucket}")
             return True
         except Exception as e:
@@ -195,19 +292,35 @@ class MetricsExporter:
         upload_speed: float,
         download_speed: float,
         tags: Optional[Dict[str, str]] = None,
-        connections: Optional[List[Dict]] = None
+        connections: Optional[List[Tuple[str, str, str]]] = None
     ):
-        for exporter in self.exporters:
+        sample = (upload_speed, download_speed, tags, connections, time.time_ns())
+        try:
+            self._q.put_nowait(sample)
+        except queue.Full:
+            self.dropped_samples += 1
+            logger.warning(f"Metrics queue full, dropping sample (total dropped: {self.dropped_samples})")
+
+    def _drain(self):
+        while True:
+            sample = self._q.get()
+            if sample is self._STOP:
+                break
+            self._dispatch(*sample)
+
+    def _dispatch(self, upload_speed, download_speed, tags, connections, timestamp_ns):
+        for _, export in self.exporters:
             try:
-                if isinstance(exporter, PrometheusExporter):
-                    exporter.export_metrics(upload_speed, download_speed, connections)
-                elif isinstance(exporter, InfluxDBExporter):
-                    exporter.export_metrics(upload_speed, download_speed, tags, connections)
+                export(upload_speed, download_speed, tags, connections, timestamp_ns)
             except Exception as e:
                 logger.error(f"Error exporting metrics: {e}")
 
     def close(self):
-        for exporter in self.exporters:
+        # Let the worker drain pending samples before the backends go away
+        self._q.put(self._STOP)
+        self._worker.join()
+
+        for exporter, _ in self.exporters:
             try:
                 if hasattr(exporter, 'close'):
                     exporter.close()
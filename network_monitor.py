@@ -8,28 +8,56 @@ This script monitors network bandwidth usage, detects consumption spikes,
 and triggers alerts when certain thresholds are exceeded.
 """
 
+import sys
 import time
+import atexit
+import struct
+import queue
+import itertools
 import psutil
 import logging
+import logging.handlers
 import argparse
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import socket
 
+# On Linux, read psutil's raw per-NIC counters directly and skip the public
+# wrapper's namedtuple construction and wrap bookkeeping
+_raw_net_io_counters = None
+if sys.platform.startswith("linux"):
+    try:
+        from psutil._pslinux import net_io_counters as _raw_net_io_counters
+    except ImportError:
+        pass
+
 try:
     from metrics_exporter import MetricsExporter
     METRICS_EXPORT_AVAILABLE = True
 except ImportError:
     METRICS_EXPORT_AVAILABLE = False
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("network_monitor.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: records are queued by the caller and written by a listener thread,
+# so the monitor loop never blocks on file/console I/O
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler("network_monitor.log"),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.SimpleQueue()
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+
+log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+log_listener.start()
+# Flush queued log records at interpreter exit, however the process gets there
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Default thresholds in Mbps
@@ -38,6 +66,115 @@ DEFAULT_THRESHOLDS = {
     'download': 150  # 100 Mbps
 }
 
+# Active connection as handed to the exporters; remote_port is already a string
+Conn = namedtuple("Conn", "remote_ip remote_port hostname")
+
+# Reverse-DNS cache: ip -> (hostname, expires_at), bounded in LRU order
+DNS_CACHE_TTL = 300
+DNS_CACHE_SIZE = 4096
+_dns_cache = OrderedDict()
+_dns_pending = set()
+_dns_lock = threading.Lock()
+_dns_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dns")
+
+
+def _resolve_hostname(ip):
+    """Resolve ``ip`` in a worker thread and store the result in the DNS cache."""
+    try:
+        host = socket.getnameinfo((ip, 0), socket.NI_NAMEREQD | socket.NI_NUMERICSERV)[0]
+    except OSError:
+        host = None
+    with _dns_lock:
+        _dns_cache[ip] = (host or "N/A", time.monotonic() + DNS_CACHE_TTL)
+        _dns_cache.move_to_end(ip)
+        while len(_dns_cache) > DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+        _dns_pending.discard(ip)
+
+
+def lookup_hostname(ip):
+    """
+    Return the cached hostname for an IP without blocking on DNS.
+
+    Unknown or expired entries are resolved in the background; until the
+    lookup completes the previous value (or "N/A") is returned.
+
+    Args:
+        ip (str): Remote IP address
+    Returns:
+        str: Hostname or "N/A"
+    """
+    with _dns_lock:
+        entry = _dns_cache.get(ip)
+        if entry is not None:
+            _dns_cache.move_to_end(ip)
+            if entry[1] > time.monotonic():
+                return entry[0]
+        if ip not in _dns_pending:
+            _dns_pending.add(ip)
+            _dns_executor.submit(_resolve_hostname, ip)
+    return entry[0] if entry is not None else "N/A"
+
+
+# Linux exposes the socket tables directly; reading them avoids psutil's /proc/*/fd walk
+PROC_NET_TCP = ("/proc/net/tcp", "/proc/net/tcp6")
+TCP_ESTABLISHED = "01"
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _decode_proc_address(address):
+    """
+    Decode a /proc/net/tcp{,6} "HEXIP:HEXPORT" address.
+
+    Args:
+        address (str): Address field as found in /proc/net/tcp or /proc/net/tcp6
+    Returns:
+        tuple: (ip, port)
+    """
+    ip_hex, port_hex = address.split(":")
+    raw = bytes.fromhex(ip_hex)
+    # Addresses are dumped as host-order 32-bit words; only little-endian hosts need a swap
+    if len(raw) == 4:
+        if _LITTLE_ENDIAN:
+            raw = raw[::-1]
+        ip = socket.inet_ntop(socket.AF_INET, raw)
+    else:
+        if _LITTLE_ENDIAN:
+            raw = struct.pack(">4I", *struct.unpack("<4I", raw))
+        ip = socket.inet_ntop(socket.AF_INET6, raw)
+    return ip, int(port_hex, 16)
+
+
+def _iter_proc_connections():
+    """
+    Yield established TCP remote endpoints straight from /proc/net/tcp{,6}.
+
+    Yields:
+        tuple: (remote_ip, remote_port)
+    """
+    for path in PROC_NET_TCP:
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        for line in lines[1:]:
+            fields = line.split()
+            if fields[3] == TCP_ESTABLISHED:
+                yield _decode_proc_address(fields[2])
+
+
+def _iter_psutil_connections():
+    """
+    Yield established TCP remote endpoints through psutil (non-Linux fallback).
+
+    Yields:
+        tuple: (remote_ip, remote_port)
+    """
+    for c in psutil.net_connections(kind="tcp"):
+        if c.raddr and c.status == psutil.CONN_ESTABLISHED:  # só conexões remotas
+            yield c.raddr.ip, c.raddr.port
+
 
 def get_active_connections(limit=5):
     """
@@ -46,23 +183,15 @@ def get_active_connections(limit=5):
     Args:
         limit (int): Maximum number of connections to return
     Returns:
-        list of dict: Connection details
+        list of Conn: Connection details
     """
-    conns = psutil.net_connections(kind="inet")
-    results = []
-    for c in conns:
-        if c.raddr:  # só conexões remotas
-            ip = c.raddr.ip
-            try:
-                host = socket.gethostbyaddr(ip)[0]
-            except Exception:
-                host = None
-            results.append({
-                "remote_ip": ip,
-                "remote_port": c.raddr.port,
-                "hostname": host or "N/A"
-            })
-    return results[:limit]
+    if sys.platform.startswith("linux"):
+        remotes = _iter_proc_connections()
+    else:
+        remotes = _iter_psutil_connections()
+
+    # Stop iterating (and resolving hostnames) once 'limit' connections are found
+    return [Conn(ip, str(port), lookup_hostname(ip)) for ip, port in itertools.islice(remotes, limit)]
 
 
 class NetworkMonitor:
@@ -79,37 +208,113 @@ class NetworkMonitor:
         """
         self.thresholds = thresholds or DEFAULT_THRESHOLDS
         self.interval = interval
-        self.prev_net_io = None
+        self._prev_sent = None
+        self._prev_recv = None
+        # Per-NIC raw counters and the wrap-compensated totals built from them
+        self._nic_prev = {}
+        self._sent_total = 0
+        self._recv_total = 0
+        self._mbps_scale = 8.0 / 1_000_000.0  # bytes -> megabits
+        self._last_t = None
+        self._last_conn_hash = object()  # never equal, so the first tick is always exported
         self.metrics_exporter = metrics_exporter
+        # Host/interface tags don't change while running, so resolve them once
+        self._tags = self.get_host_tags()
         logger.info(f"Network monitor initialized with thresholds: {self.thresholds}")
 
+    def get_host_tags(self):
+        """
+        Get the host address and interface name used to tag exported metrics.
+
+        Returns:
+            dict: {"host": host_addr, "interface": interface_name}
+        """
+        # Initialize variables with default values
+        host_addr = "unknown"
+        interface_name = "unknown"
+
+        try:
+            # Get network interfaces
+            net_if_addrs = psutil.net_if_addrs()
+
+            # Get the first interface name (usually the main one)
+            if net_if_addrs:
+                interface_name = list(net_if_addrs.keys())[0]
+                # Get the first address object for this interface
+                if net_if_addrs[interface_name] and len(net_if_addrs[interface_name]) > 0:
+                    addr_info = net_if_addrs[interface_name][0]
+                    # Check if it's a proper address object or a dict
+                    if hasattr(addr_info, 'address'):
+                        host_addr = addr_info.address
+                    elif isinstance(addr_info, dict) and 'address' in addr_info:
+                        host_addr = addr_info['address']
+        except (IndexError, KeyError, AttributeError, OSError) as e:
+            logger.debug(f"Error getting network interface details: {e}")
+
+        return {"host": host_addr, "interface": interface_name}
+
     def get_network_usage(self):
-        """Get current network usage statistics."""
-        return psutil.net_io_counters()
+        """
+        Get current network usage statistics.
 
-    def calculate_bandwidth(self, current_net_io):
+        Returns:
+            tuple: (bytes_sent, bytes_recv) summed over all interfaces. On Linux
+                these count from the first call, so only their deltas are meaningful.
+        """
+        if _raw_net_io_counters is not None:
+            prev = self._nic_prev
+            current = _raw_net_io_counters()
+            for nic, counters in current.items():
+                last = prev.get(nic)
+                if last is not None:
+                    ds = counters[0] - last[0]
+                    dr = counters[1] - last[1]
+                    # Counters can be 32-bit on some drivers; a drop means the NIC
+                    # wrapped or was reset, so count from zero like psutil's nowrap
+                    self._sent_total += ds if ds >= 0 else counters[0]
+                    self._recv_total += dr if dr >= 0 else counters[1]
+                prev[nic] = counters
+            if len(prev) != len(current):
+                for nic in prev.keys() - current.keys():
+                    del prev[nic]
+            return self._sent_total, self._recv_total
+        io = psutil.net_io_counters()
+        return io.bytes_sent, io.bytes_recv
+
+    def calculate_bandwidth(self, current_net_io, elapsed=None):
         """
         Calculate bandwidth usage based on previous and current measurements.
 
+        Args:
+            current_net_io (tuple): (bytes_sent, bytes_recv) from get_network_usage()
+            elapsed (float, optional): Seconds since the previous measurement.
+                Defaults to the configured interval.
+
         Returns:
             tuple: (upload_speed_mbps, download_speed_mbps)
         """
-        if self.prev_net_io is None:
-            self.prev_net_io = current_net_io
+        sent, recv = current_net_io
+        if self._prev_sent is None:
+            self._prev_sent, self._prev_recv = sent, recv
             return 0, 0
 
         # Calculate bytes transferred during the interval
-        bytes_sent = current_net_io.bytes_sent - self.prev_net_io.bytes_sent
-        bytes_recv = current_net_io.bytes_recv - self.prev_net_io.bytes_recv
-
-        # Convert to Mbps (Megabits per second)
-        upload_speed_mbps = (bytes_sent * 8) / (self.interval * 1_000_000)
-        download_speed_mbps = (bytes_recv * 8) / (self.interval * 1_000_000)
+        ds = sent - self._prev_sent
+        dr = recv - self._prev_recv
+        # Totals only go backwards when psutil stops summing a removed NIC
+        if ds < 0:
+            ds = 0
+        if dr < 0:
+            dr = 0
 
         # Update previous values
-        self.prev_net_io = current_net_io
+        self._prev_sent, self._prev_recv = sent, recv
 
-        return upload_speed_mbps, download_speed_mbps
+        # Convert to Mbps (Megabits per second) over the measured elapsed time
+        if not elapsed or elapsed <= 0:
+            elapsed = self.interval
+        scale = self._mbps_scale / elapsed
+        return ds * scale, dr * scale
 
     def check_thresholds(self, upload_speed, download_speed):
         """
@@ -154,9 +359,9 @@ class NetworkMonitor:
         Args:
             duration (int, optional): Duration to monitor in seconds. If None, runs indefinitely.
         """
-        global active_conns
         logger.info("Starting network monitoring...")
         start_time = time.time()
+        next_t = time.monotonic()
 
         try:
             while True:
@@ -165,11 +370,16 @@ class NetworkMonitor:
                     logger.info(f"Monitoring completed after {duration} seconds")
                     break
 
+                active_conns = None
+
                 # Get current network usage
                 current_net_io = self.get_network_usage()
+                sample_t = time.monotonic()
+                elapsed = sample_t - self._last_t if self._last_t is not None else None
+                self._last_t = sample_t
 
                 # Calculate bandwidth
-                upload_speed, download_speed = self.calculate_bandwidth(current_net_io)
+                upload_speed, download_speed = self.calculate_bandwidth(current_net_io, elapsed)
 
                 # Log current bandwidth usage
                 if upload_speed > 0 or download_speed > 0:  # Only log if there's actual traffic
@@ -178,44 +388,39 @@ class NetworkMonitor:
                     active_conns = get_active_connections(limit=5)
                     for conn in active_conns:
                         logger.info(
-                            f"Conn -> {conn['remote_ip']}:{conn['remote_port']} ({conn['hostname']})"
+                            f"Conn -> {conn.remote_ip}:{conn.remote_port} ({conn.hostname})"
                         )
 
                 # Export metrics if exporter is available
                 if self.metrics_exporter:
-                    try:
-                        # Get network interfaces
-                        net_if_addrs = psutil.net_if_addrs()
-
-                        # Initialize variables with default values
-                        host_addr = "unknown"
-                        interface_name = "unknown"
-
-                        # Get the first interface name (usually the main one)
-                        if net_if_addrs:
-                            try:
-                                interface_name = list(net_if_addrs.keys())[0]
-                                # Get the first address object for this interface
-                                if net_if_addrs[interface_name] and len(net_if_addrs[interface_name]) > 0:
-                                    addr_info = net_if_addrs[interface_name][0]
-                                    # Check if it's a proper address object or a dict
-                                    if hasattr(addr_info, 'address'):
-                                        host_addr = addr_info.address
-                                    elif isinstance(addr_info, dict) and 'address' in addr_info:
-                                        host_addr = addr_info['address']
-                            except (IndexError, KeyError, AttributeError) as e:
-                                logger.debug(f"Error getting network interface details: {e}")
-
-                           ##self.metrics_exporter.export_metrics(upload_speed=float(upload_speed),download_speed=float(download_speed),tags={"host": host_addr, "interface": interface_name},connections=active_conns)
-
-                    except Exception as e:
-                        logger.error(f"Error exporting metrics: {e}")
+                    conn_hash = None
+                    if active_conns is not None:
+                        conn_hash = hash(frozenset((c.remote_ip, c.remote_port) for c in active_conns))
+                    # Idle tick with nothing new: exporters already hold these values
+                    idle = upload_speed == 0 and download_speed == 0 and conn_hash == self._last_conn_hash
+                    if not idle:
+                        try:
+                            self.metrics_exporter.export_metrics(
+                                upload_speed=float(upload_speed),
+                                download_speed=float(download_speed),
+                                tags=self._tags,
+                                connections=active_conns
+                            )
+                        except Exception as e:
+                            logger.error(f"Error exporting metrics: {e}")
+                        self._last_conn_hash = conn_hash
 
                 # Check if thresholds are exceeded
                 self.check_thresholds(upload_speed, download_speed)
 
-                # Wait for the next interval
-                time.sleep(self.interval)
+                # Wait for the next deadline so the sample period doesn't drift with work time
+                next_t += self.interval
+                sleep_s = next_t - time.monotonic()
+                if sleep_s > 0:
+                    time.sleep(sleep_s)
+                else:
+                    # Fell behind by more than an interval; don't try to catch up in a burst
+                    next_t = time.monotonic()
 
         except KeyboardInterrupt:
             logger.info("Monitoring stopped by user")
@@ -309,3 +514,6 @@ if __name__ == "__main__":
                 metrics_exporter.close()
             except Exception as e:
                 logger.error(f"Error closing metrics exporter: {e}")
+
+        # Drop pending reverse lookups instead of waiting on slow resolvers
+        _dns_executor.shutdown(wait=False, cancel_futures=True)
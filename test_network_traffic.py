@@ -8,57 +8,135 @@ This script generates artificial network traffic to test the Network Bandwidth M
 It simulates both upload and download traffic by sending and receiving data.
 """
 
-import time
+import os
 import socket
 import random
+import asyncio
 import argparse
-import threading
-from urllib.request import urlopen
+import tempfile
+from urllib.parse import urlparse
 
-def generate_download_traffic(duration=60, intensity=5):
+import aiohttp
+
+# Upload payload for the highest intensity (10 MiB), written once to a scratch
+# file so socket.sendfile() can stream it with the kernel's zero-copy sendfile(2)
+_PAYLOAD_SIZE = 10 * 1024 * 1024
+_PAYLOAD = tempfile.TemporaryFile()
+_PAYLOAD.write(b'X' * _PAYLOAD_SIZE)
+_PAYLOAD.flush()
+
+# URLs to download from (add more as needed)
+_URLS = (
+    "https://speed.hetzner.de/100MB.bin",
+    "https://proof.ovh.net/files/100Mb.dat",
+    "https://speed.cloudflare.com/__down?bytes=10000000"
+)
+
+# Servers to upload to (these are echo servers that will discard the data)
+_UPLOAD_SERVERS = (
+    ("tcpbin.com", 4242),
+    ("echo.websocket.org", 80),
+    ("localhost", 8000)  # Fallback to localhost if external servers are unavailable
+)
+
+# Private generator: avoids the shared module-level random instance
+_RNG = random.Random()
+
+UPLOAD_SNDBUF = 4 * 1024 * 1024  # Socket send buffer size in bytes
+UPLOAD_SEND_TIMEOUT = 30  # Seconds allowed for sending one payload
+
+async def _download(session, url):
+    """Stream a single download, discarding the data."""
+    try:
+        async with session.get(url) as response:
+            # Drain as fast as the network delivers, taking aiohttp's already-received
+            # buffers as-is instead of re-slicing/joining them into fixed-size chunks
+            async for _ in response.content.iter_any():
+                pass
+    except Exception as e:
+        print(f"Download error: {e}")
+        await asyncio.sleep(1)
+
+async def generate_download_traffic(duration=60, intensity=5):
     """
     Generate download traffic by downloading data from the internet.
     
+    Up to `intensity` downloads run concurrently on one shared session.
+    
     Args:
         duration (int): Duration in seconds to generate traffic
         intensity (int): Intensity level (1-10) affecting the size and frequency of downloads
     """
     print(f"Generating download traffic for {duration} seconds (intensity: {intensity})...")
     
-    # List of URLs to download from (add more as needed)
-    urls = [
-        "https://speed.hetzner.de/100MB.bin",
-        "https://proof.ovh.net/files/100Mb.dat",
-        "https://speed.cloudflare.com/__down?bytes=10000000"
-    ]
-    
-    start_time = time.time()
-    while time.time() - start_time < duration:
-        try:
-            # Select a random URL
-            url = random.choice(urls)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    sem = asyncio.Semaphore(intensity)
+    tasks = set()
+    
+    def _done(task):
+        tasks.discard(task)
+        sem.release()
+    
+    # Timeouts apply per connect/read (as urlopen's did), not to the whole download
+    timeout = aiohttp.ClientTimeout(sock_connect=5, sock_read=5)
+    # Cache resolved addresses for the whole run and stick to IPv4 to skip slow dual-stack fallbacks
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=4, use_dns_cache=True,
+                                     ttl_dns_cache=600, family=socket.AF_INET)
+    
+    # Prewarm DNS for every download host before the first request
+    await asyncio.gather(
+        *[loop.getaddrinfo(urlparse(url).hostname, 443, family=socket.AF_INET) for url in _URLS],
+        return_exceptions=True
+    )
+    
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        while loop.time() < deadline:
+            # Wait for a free download slot
+            try:
+                await asyncio.wait_for(sem.acquire(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
             
-            # Download data (with a timeout to prevent hanging)
-            response = urlopen(url, timeout=5)
+            # Select a random URL
+            url = _URLS[_RNG.randrange(len(_URLS))]
+            task = asyncio.create_task(_download(session, url))
+            tasks.add(task)
+            task.add_done_callback(_done)
             
-            # Read data in chunks to control the download rate
-            chunk_size = 1024 * intensity
-            while True:
-                data = response.read(chunk_size)
-                if not data:
-                    break
-                
-                # Pause briefly to control download rate
-                time.sleep(0.01 / intensity)
-                
-        except Exception as e:
-            print(f"Download error: {e}")
-            time.sleep(1)
+            # Pause between downloads
+            await asyncio.sleep(max(0.1, 1 - (intensity / 10)))
         
-        # Pause between downloads
-        time.sleep(max(0.1, 1 - (intensity / 10)))
+        # Stop downloads still running when the duration is up
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _connect_upload_server(servers, start_index=0):
+    """
+    Connect to the first reachable upload server, starting at `start_index`.
+    
+    Returns:
+        tuple: (non-blocking socket or None, index of the server that was tried last)
+    """
+    loop = asyncio.get_running_loop()
+    for offset in range(len(servers)):
+        index = (start_index + offset) % len(servers)
+        host, port = servers[index]
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.setblocking(False)
+            await asyncio.wait_for(loop.sock_connect(s, (host, port)), 2)
+            # Large send buffer and no Nagle delay: let TCP pace the upload
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UPLOAD_SNDBUF)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return s, index
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Upload error ({host}:{port}): {e!r}")
+            s.close()
+    return None, start_index
 
-def generate_upload_traffic(duration=60, intensity=5):
+async def generate_upload_traffic(duration=60, intensity=5):
     """
     Generate upload traffic by sending data to a remote server.
     
@@ -68,41 +146,53 @@ def generate_upload_traffic(duration=60, intensity=5):
     """
     print(f"Generating upload traffic for {duration} seconds (intensity: {intensity})...")
     
-    # List of servers to upload to (these are echo servers that will discard the data)
-    servers = [
-        ("tcpbin.com", 4242),
-        ("echo.websocket.org", 80),
-        ("localhost", 8000)  # Fallback to localhost if external servers are unavailable
-    ]
-    
-    start_time = time.time()
-    while time.time() - start_time < duration:
-        # Try each server until one works
-        for host, port in servers:
+    servers = _UPLOAD_SERVERS
+    
+    payload_size = 1024 * 1024 * intensity
+    
+    # One connection is kept open for the whole run and only replaced when it fails
+    s = None
+    server_index = 0
+    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    try:
+        while loop.time() < deadline:
+            if s is None:
+                s, server_index = await _connect_upload_server(servers, server_index)
+                if s is None:
+                    await asyncio.sleep(1)
+                    continue
+            
+            host, port = servers[server_index]
             try:
-                # Create a socket
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(2)
-                    s.connect((host, port))
-                    
-                    # Generate random data to send
-                    data_size = 1024 * 1024 * intensity  # Size in bytes
-                    data = b'X' * data_size
-                    
-                    # Send data in chunks
-                    chunk_size = 1024 * intensity
-                    for i in range(0, len(data), chunk_size):
-                        chunk = data[i:i+chunk_size]
-                        s.sendall(chunk)
-                        time.sleep(0.01 / intensity)  # Control upload rate
-                    
-                    break  # If successful, break the server loop
-            except Exception as e:
-                print(f"Upload error ({host}:{port}): {e}")
+                # Send the whole payload from the scratch file; the kernel send buffer regulates the rate
+                await asyncio.wait_for(loop.sock_sendfile(s, _PAYLOAD, 0, payload_size), UPLOAD_SEND_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"Upload error ({host}:{port}): {e!r}")
+                s.close()
+                s = None
+                # Reconnect to the next server in the list
+                server_index = (server_index + 1) % len(servers)
                 continue
-        
-        # Pause between uploads
-        time.sleep(max(0.1, 1 - (intensity / 10)))
+    finally:
+        if s is not None:
+            s.close()
+
+def pin_to_cpu():
+    """
+    Pin the process (and so its event loop) to one CPU so socket state stays cache-local.
+    
+    Only supported on Linux; elsewhere this is a no-op.
+    
+    Returns:
+        int or None: The CPU pinned to, or None if pinning isn't available
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    cpu = min(os.sched_getaffinity(0))
+    os.sched_setaffinity(0, {cpu})
+    return cpu
 
 def parse_arguments():
     """Parse command-line arguments."""
@@ -132,29 +222,18 @@ if __name__ == "__main__":
     generate_download = not args.upload_only
     generate_upload = not args.download_only
     
-    # Create threads for traffic generation
-    threads = []
-    
-    if generate_download:
-        download_thread = threading.Thread(
-            target=generate_download_traffic,
-            args=(args.duration, args.download_intensity)
-        )
-        threads.append(download_thread)
-    
-    if generate_upload:
-        upload_thread = threading.Thread(
-            target=generate_upload_traffic,
-            args=(args.duration, args.upload_intensity)
-        )
-        threads.append(upload_thread)
-    
-    # Start threads
-    for thread in threads:
-        thread.start()
-    
-    # Wait for threads to complete
-    for thread in threads:
-        thread.join()
+    async def main():
+        # Both generators share one event loop; a failure in one cancels the other
+        async with asyncio.TaskGroup() as tg:
+            if generate_download:
+                tg.create_task(generate_download_traffic(args.duration, args.download_intensity))
+            if generate_upload:
+                tg.create_task(generate_upload_traffic(args.duration, args.upload_intensity))
+    
+    cpu = pin_to_cpu()
+    if cpu is not None:
+        print(f"Pinned traffic generation to CPU {cpu}")
+    
+    asyncio.run(main())
     
     print("Traffic generation completed.")
\ No newline at end of file
@@ -1,6 +1,6 @@
-import requests
-import concurrent.futures
-import time
+import aiohttp
+import asyncio
+import os
 import statistics
 
 URL = "http://localhost:6000/api/storage/v1/upload"
@@ -14,46 +14,57 @@ PARAMS = {
 }
 HEADERS = {"Accept": "application/json"}
 FILE_PATH = r"C:/Users/Casa/Downloads/certidao_de-inteiro_teor_chassi-9C2KC2500PR123372 (1).pdf"
+NUM_REQUESTS = 10  # número de uploads concorrentes
 
+# Arquivo lido uma única vez; todos os uploads compartilham o mesmo bytes
+with open(FILE_PATH, "rb") as f:
+    PDF_BLOB = f.read()
 
-def upload_file(i):
+
+async def upload_file(session, sem, i):
     """Função para simular upload de um arquivo e medir tempo"""
-    try:
-        start = time.perf_counter()
-        with open(FILE_PATH, "rb") as f:
-            files = {"file": (FILE_PATH, f, "application/pdf")}
-            response = requests.post(URL, params=PARAMS, headers=HEADERS, files=files)
-        elapsed = time.perf_counter() - start
+    loop = asyncio.get_running_loop()
+    async with sem:
+        try:
+            start = loop.time()
+            data = aiohttp.FormData()
+            data.add_field("file", PDF_BLOB, filename=os.path.basename(FILE_PATH), content_type="application/pdf")
+            async with session.post(URL, params=PARAMS, headers=HEADERS, data=data) as response:
+                text = await response.text()
+            elapsed = loop.time() - start
 
-        return {
-            "id": i,
-            "status": response.status_code,
-            "elapsed": elapsed,
-            "ok": response.ok,
-            "message": response.text[:200]
-        }
-    except Exception as e:
-        return {
-            "id": i,
-            "status": "ERR",
-            "elapsed": 0,
-            "ok": False,
-            "message": str(e)
-        }
+            return {
+                "id": i,
+                "status": response.status,
+                "elapsed": elapsed,
+                "ok": response.ok,
+                "message": text[:200]
+            }
+        except Exception as e:
+            return {
+                "id": i,
+                "status": "ERR",
+                "elapsed": 0,
+                "ok": False,
+                "message": str(e)
+            }
 
 
-def main():
-    num_requests = 10  # número de uploads concorrentes
-    results = []
+async def run_uploads(num_requests):
+    """Dispara os uploads concorrentes em um único event loop, reaproveitando as conexões."""
+    sem = asyncio.Semaphore(num_requests)
+    connector = aiohttp.TCPConnector(limit=num_requests, force_close=False)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*[upload_file(session, sem, i) for i in range(num_requests)])
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_requests) as executor:
-        futures = [executor.submit(upload_file, i) for i in range(num_requests)]
-        for future in concurrent.futures.as_completed(futures):
-            results.append(future.result())
+
+def main():
+    num_requests = NUM_REQUESTS
+    results = asyncio.run(run_uploads(num_requests))
 
     # --- Métricas ---
     success_times = [r["elapsed"] for r in results if r["ok"]]
-    success_count = sum(1 for r in results if r["ok"])
+    success_count = sum(r["ok"] for r in results)
     fail_count = len(results) - success_count
 
     print("\n=== Resultados Individuais ===")
@@ -65,7 +76,7 @@ def main():
     print(f"Sucessos: {success_count} | Falhas: {fail_count}")
 
     if success_times:
-        print(f"Tempo médio: {statistics.mean(success_times):.2f}s")
+        print(f"Tempo médio: {statistics.fmean(success_times):.2f}s")
         print(f"Tempo mínimo: {min(success_times):.2f}s")
         print(f"Tempo máximo: {max(success_times):.2f}s")
         if len(success_times) > 1:
@@ -1,7 +1,9 @@
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+import aiofiles
+import aiohttp
+import asyncio
+import numpy as np
 import os
+import time
 
 # Configurações do teste
 URL = "http://localhost:6000/api/storage/v1/upload"
@@ -10,7 +12,45 @@ MAX_WORKERS = 10  # Tentaremos mais do que o limite de 5
 FILES_TO_UPLOAD = 5  # Número total de uploads para testar concorrência
 CHUNK_SIZE = 1024 * 1024  # 1 MB por chunk
 
-def upload_file_with_chunk_timing(i):
+
+class ChunkTimings:
+    """Tamanhos e durações das leituras de chunk em arrays numpy pré-alocados."""
+
+    def __init__(self, capacity=1 << 14):
+        self.sizes = np.empty(capacity, dtype=np.int64)
+        self.durs = np.empty(capacity, dtype=np.int64)  # nanossegundos
+        self.n = 0
+
+    def add(self, size, dur_ns):
+        if self.n == len(self.sizes):
+            self.sizes = np.resize(self.sizes, 2 * self.n)
+            self.durs = np.resize(self.durs, 2 * self.n)
+        self.sizes[self.n] = size
+        self.durs[self.n] = dur_ns
+        self.n += 1
+
+    def rates(self):
+        """Taxas por chunk em MB/s, ignorando leituras com duração zero."""
+        s = self.sizes[:self.n]
+        d = self.durs[:self.n]
+        mask = d > 0
+        return s[mask] / (d[mask] * 1e-9) / (1024*1024)
+
+
+async def read_chunks_with_timing(path, chunk_times):
+    """Lê o arquivo em chunks de CHUNK_SIZE sem bloquear o loop, medindo o tempo de cada leitura."""
+    async with aiofiles.open(path, "rb") as f:
+        while True:
+            start = time.monotonic_ns()
+            chunk = await f.read(CHUNK_SIZE)
+            dur_ns = time.monotonic_ns() - start
+            if not chunk:
+                break
+            chunk_times.add(len(chunk), dur_ns)
+            yield chunk
+
+
+async def upload_file_with_chunk_timing(i, session, sem):
     params = {
         "nameFile": f"PILOTO/test_file_{i}.pdf",
         "typeFile": "application/pdf",
@@ -20,48 +60,43 @@ def upload_file_with_chunk_timing(i):
         "storageTier": "COOL"
     }
 
-    file_size = os.path.getsize(FILE_PATH)
-    chunk_times = []
-
-    class FileWrapper:
-        def __init__(self, path):
-            self.f = open(path, "rb")
-        def read(self, n=-1):
-            if n <= 0:
-                n = CHUNK_SIZE
-            start = time.time()
-            chunk = self.f.read(n)
-            end = time.time()
-            if chunk:
-                duration = end - start
-                chunk_times.append((len(chunk), duration))
-            return chunk
-        def close(self):
-            self.f.close()
-
-    files = {"file": (os.path.basename(FILE_PATH), FileWrapper(FILE_PATH), "application/pdf")}
-    try:
-        response = requests.post(URL, params=params, files=files)
-        # Calculando taxa média por chunk
-        rates = [(size / duration) / (1024*1024) for size, duration in chunk_times if duration > 0]
-        avg_rate = sum(rates)/len(rates) if rates else 0
-        max_rate = max(rates) if rates else 0
-        min_rate = min(rates) if rates else 0
-
-        if response.status_code == 429:
-            return f"[{i}] TOO MANY REQUESTS - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
-        elif response.status_code == 200:
-            return f"[{i}] Upload OK - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
-        else:
-            return f"[{i}] Status {response.status_code} - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
-    except Exception as e:
-        return f"[{i}] Exception: {e}"
-    finally:
-        files["file"][1].close()
-
-
-# Executando uploads simultâneos
-with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-    futures = [executor.submit(upload_file_with_chunk_timing, i) for i in range(FILES_TO_UPLOAD)]
-    for future in as_completed(futures):
-        print(future.result())
+    chunk_times = ChunkTimings()
+
+    async with sem:
+        try:
+            # O arquivo é enviado em streaming à medida que os chunks são lidos
+            data = aiohttp.FormData()
+            data.add_field("file", read_chunks_with_timing(FILE_PATH, chunk_times),
+                           filename=os.path.basename(FILE_PATH), content_type="application/pdf")
+            async with session.post(URL, params=params, data=data) as response:
+                status = response.status
+                await response.read()
+            # Calculando taxa média por chunk
+            rates = chunk_times.rates()
+            avg_rate = rates.mean() if rates.size else 0
+            max_rate = rates.max() if rates.size else 0
+            min_rate = rates.min() if rates.size else 0
+
+            if status == 429:
+                return f"[{i}] TOO MANY REQUESTS - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
+            elif status == 200:
+                return f"[{i}] Upload OK - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
+            else:
+                return f"[{i}] Status {status} - Avg: {avg_rate:.2f} MB/s, Max: {max_rate:.2f} MB/s, Min: {min_rate:.2f} MB/s"
+        except Exception as e:
+            return f"[{i}] Exception: {e}"
+
+
+async def upload_and_print(i, session, sem):
+    # Cada upload imprime o próprio resultado ao terminar
+    print(await upload_file_with_chunk_timing(i, session, sem))
+
+
+async def main():
+    # Executando uploads simultâneos em um único event loop
+    sem = asyncio.Semaphore(MAX_WORKERS)
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[upload_and_print(i, session, sem) for i in range(FILES_TO_UPLOAD)])
+
+
+asyncio.run(main())